@@ -21,11 +21,57 @@ The code is commented by the authors. Where subsequent chunks present similar an
 ## Data Wrangling
 """
 
+import os
+import gc
 import pandas as pd
 import numpy as np
+import matplotlib.pyplot as plt
+import seaborn as sns
+
+# The figures of the model sections (trees, confusion matrices and feature importances) are drawn only when the
+# environment variable VB_PLOT is set to 1 (the figures of the descriptive statistics are always drawn)
+PLOT = os.environ.get('VB_PLOT', '0') == '1'
 
-# The dataset is retrievable in .csv format, imported here:
-df = pd.read_csv('ESS11.csv')
+"""The labels of the coded variables are used by the plots of all the sections: we define them before loading the data, so that the Machine Learning section can also be run from the cleaned dataset saved below."""
+
+# We ceate a separate dictionary for labels:
+label_names = {
+    'Gender': {1: 'Male', 2: 'Female'},
+    'EducationLevel': {
+        0: 'Not harmonized', 1: 'Less than lower secondary', 2: 'Lower secondary',
+        3: 'Upper secondary', 4: 'Post-secondary', 5: 'Tertiary - first stage',
+        6: 'Tertiary - BA level', 7: 'Tertiary - >=MA level'},
+    'Region' : {0: 'Nord-Ovest', 1: 'Sud', 2: 'Isole', 3: 'Nord-Est', 4: 'Centro'},
+    'HouseholdIncome': {**{i: f'Income decile {i}' for i in range(1, 11)}},
+    'EmploymentStatus': {1: 'Employee', 2: 'Self-employed', 3: 'Family business', 6: 'Not applicable'},
+    'TradeUnionMember': {1: 'Yes, currently', 2: 'Yes, previously', 3: 'No'},
+    'PoliticalInterest': {1: 'Very interestd', 2: 'Quite interested', 3: 'Hardly interested', 4: 'Not at all interested'},
+    'LeftRightScale': {0: 'Left', **{i: f'Position {i}' for i in range(1, 10)}, 10: 'Right'},
+    'SatisfactionDemocracy': {0: 'Extremely dissatisfied', **{i: f'Level {i}' for i in range(1, 10)}, 10: 'Extremely satisfied'},
+    'TrustEP': {0: 'No trust', **{i: f'Level {i}' for i in range(1, 10)}, 10: 'Complete trust'},
+    'Religion': {0: 'Not at all', **{i: f'Position {i}' for i in range(1, 10)}, 10: 'Very Religious'},
+    'ZeroPayGapOpinion': {0: 'Very bad for Economy', **{i: f'Level {i}' for i in range(1, 6)}, 6: 'Very good for Economy'},
+    'AttitudeTowardLGBT': {1: 'Strongly agree', 2: 'Agree', 3: 'Neutral', 4: 'Disagree', 5: 'Strongly disagree'},
+    'VotedCoalition': {1: 'CSX', 2: 'M5S', 3: 'TerzoPolo', 4: "CDX"},
+    'AttitudesTowardImmigration': {0: 'Imm. makes place worse', **{i: f'Level {i}' for i in range(1, 10)}, 10: 'Imm. makes place better'},
+}
+
+"""We load the data."""
+
+# List of the columns to keep in our analysis (see the description of the variables below)
+columns_to_keep = ['agea', 'gndr', 'eisced', 'hinctnta', 'region', 'emplrel',
+                   'mbtru', 'polintr', 'lrscale', 'stfdem', 'trstep',
+                   'rlgdgr', 'imwbcnt', 'nwspol', 'freehms', 'eqpaybg', 'prtvteit']
+
+# Compact dtypes for the selected columns (nullable integers, since some variables are not asked in all countries)
+column_dtypes = {'agea': 'Int16', 'gndr': 'Int8', 'eisced': 'Int8', 'hinctnta': 'Int8', 'region': 'category',
+                 'emplrel': 'Int8', 'mbtru': 'Int8', 'polintr': 'Int8', 'lrscale': 'Int8', 'stfdem': 'Int8',
+                 'trstep': 'Int8', 'rlgdgr': 'Int8', 'imwbcnt': 'Int8', 'nwspol': 'Int32', 'freehms': 'Int8',
+                 'eqpaybg': 'Int8', 'prtvteit': 'Int16'}
+
+# The dataset is retrievable in .csv format, imported here. We parse only the columns used in the analysis,
+# with the pyarrow engine (multithreaded csv parser)
+df = pd.read_csv('ESS11.csv', usecols=columns_to_keep, dtype=column_dtypes, engine='pyarrow')
 
 print(df.head())
 
@@ -60,13 +106,12 @@ D. Social and Cultural Attitudes:
 * Men-Women zero pay gap good for the economy. eqpaybg.
 """
 
-# List of the columns to keep in our analysis
-columns_to_keep = ['agea', 'gndr', 'eisced', 'hinctnta', 'region', 'emplrel',
-                   'mbtru', 'polintr', 'lrscale', 'stfdem', 'trstep',
-                   'rlgdgr', 'imwbcnt', 'nwspol', 'freehms', 'eqpaybg', 'prtvteit']
+# The dataframe already contains only the selected columns (usecols above), we just put them in the listed order
+df_selected = df.reindex(columns=columns_to_keep)
 
-# Create a new dataframe with only the selected columns
-df_selected = df[columns_to_keep]
+# The original dataframe is not used anymore: we free its memory
+del df
+gc.collect()
 
 # Display and monitor the size
 print(df_selected.head())
@@ -94,7 +139,7 @@ column_mapping = {
     'prtvteit': 'VotedParty'
 }
 
-df_selected = df_selected.rename(columns=column_mapping)
+df_selected.rename(columns=column_mapping, inplace=True)
 
 
 # You may want to use this list to select the colums desired for your analysis, using the new names
@@ -126,23 +171,22 @@ print(df_selected['VotedParty'].value_counts())
 df_selected = df_selected[df_selected['VotedParty'].isin(set(range(1, 10)) - {9})]
 
 #### Creation of the Coalitions: new variable indicating the voted coalition
-# Create the 'VotedCoalition' variable based on the values of 'VotedParty' (originally 'prtvteit')
-def assign_target(VotedParty):
-    if VotedParty in [2, 7, 8, 10]:
-        return 1 #CSX
-    elif VotedParty in [1, 4, 5]:
-        return 4 #CDX
-    elif VotedParty in [3]:
-        return 2 #M5S
-    elif VotedParty in [6]:
-        return 3 #TerzoPolo
-    else:
-        return None
-
-df_selected['VotedCoalition'] = df_selected['VotedParty'].apply(assign_target)
-
-# Drop rows where 'target' is None (due to values outside the specified range in 'VotedParty')
+# Create the 'VotedCoalition' variable based on the values of 'VotedParty' (originally 'prtvteit'),
+# through a lookup table indexed by party code (vectorized, instead of applying a function row by row)
+party_to_coalition = np.full(11, np.nan)
+party_to_coalition[[2, 7, 8, 10]] = 1 #CSX
+party_to_coalition[[1, 4, 5]] = 4 #CDX
+party_to_coalition[3] = 2 #M5S
+party_to_coalition[6] = 3 #TerzoPolo
+
+df_selected['VotedCoalition'] = party_to_coalition[df_selected['VotedParty'].to_numpy().astype(int)]
+
+# Drop rows where 'target' is NaN (due to values outside the specified range in 'VotedParty'), and keep integer labels
 df_selected = df_selected.dropna(subset=['VotedCoalition'])
+df_selected = df_selected.astype({'VotedCoalition': int})
+
+# Reset the (now sparse) index, so that the following masks and slices work on a contiguous RangeIndex
+df_selected = df_selected.reset_index(drop=True)
 
 """We proceed by handling missingness of data.
 
@@ -179,17 +223,15 @@ exclusion_rules = {
     'Region': [99999]
 }
 
-# Replace all missing codes with np.nan
-df_missing = df_selected.copy()
-for column, missing_values in exclusion_rules.items():
-    df_missing[column] = df_missing[column].replace(missing_values, np.nan)
-
-# Create missingness indicators
-missing_indicators = df_missing.isna().astype(int)
-missing_indicators.columns = [f"{col}_missing" for col in df_missing.columns]
+# Create missingness indicators directly from the missing codes (a single vectorized membership test per column),
+# without copying the whole dataset to replace the codes with np.nan
+missing_indicators = pd.DataFrame(
+    {f"{col}_missing": (df_selected[col].isna() | df_selected[col].isin(exclusion_rules.get(col, []))).to_numpy(dtype=int)
+     for col in df_selected.columns},
+    index=df_selected.index)
 
 # Add the target variable (not missing) for grouping
-missing_indicators['VotedCoalition'] = df_missing['VotedCoalition']
+missing_indicators['VotedCoalition'] = df_selected['VotedCoalition']
 
 # Group by voted coalition (target) and calculate missingness rates per variable
 grouped_missing = missing_indicators.groupby('VotedCoalition').mean()
@@ -206,8 +248,10 @@ print(grouped_missing_T.drop(columns='max_diff'))
 # We perform a MAR test for checking missingness of variable HouseholdIncome.
 from scipy.stats import chi2_contingency
 
-# Create a contingency table
-contingency_table = pd.crosstab(df_missing['HouseholdIncome'].isna(), df_missing['VotedCoalition'])
+# Create the 2x4 contingency table (income missing or not, by coalition 1-4), counting packed indices with np.bincount
+income_missing = missing_indicators['HouseholdIncome_missing'].to_numpy().astype(np.int64)
+coalition = missing_indicators['VotedCoalition'].to_numpy().astype(np.int64)
+contingency_table = np.bincount(income_missing * 5 + coalition, minlength=10).reshape(2, 5)[:, 1:]
 
 # Perform the chi-square test
 chi2, p, dof, expected = chi2_contingency(contingency_table)
@@ -220,36 +264,26 @@ print(expected)
 
 """We proceed with the cleaning of the dataset as previously discussed, by eliminating the observations with NAs and monitoring the number of observations eliminated (hence, those remaining) after each variable. \\"""
 
-# Apply all exclusion rules
+# Apply all exclusion rules: we combine them into one boolean mask and slice the dataframe only once
+# (the mask is only accumulated in the loop, so the counts printed are those left after each rule)
+keep = np.ones(len(df_selected), dtype=bool)
 for column, values_to_exclude in exclusion_rules.items():
-    df_selected = df_selected[~df_selected[column].isin(values_to_exclude)]
-    num_observations = len(df_selected)
+    keep &= ~df_selected[column].isin(values_to_exclude).to_numpy(copy=False)
+    num_observations = int(keep.sum())
     print(f"After filtering {column}, number of observations left: {num_observations}")
 
-df_filtered = df_selected
+df_filtered = df_selected.loc[keep].copy()
+
+# No missing values are left, so we store the (small-range) integer codes as plain int8: Region is still a string category
+small_int_cols = [c for c in df_filtered.select_dtypes(include='number').columns if c not in ('Age', 'MediaConsumption')]
+df_filtered[small_int_cols] = df_filtered[small_int_cols].astype('int8')
+df_filtered = df_filtered.astype({'Age': 'int16', 'MediaConsumption': 'int32'})
+
 print(df_filtered.head(10))
 
-# We ceate a separate dictionary for labels:
-label_names = {
-    'Gender': {1: 'Male', 2: 'Female'},
-    'EducationLevel': {
-        0: 'Not harmonized', 1: 'Less than lower secondary', 2: 'Lower secondary',
-        3: 'Upper secondary', 4: 'Post-secondary', 5: 'Tertiary - first stage',
-        6: 'Tertiary - BA level', 7: 'Tertiary - >=MA level'},
-    'Region' : {0: 'Nord-Ovest', 1: 'Sud', 2: 'Isole', 3: 'Nord-Est', 4: 'Centro'},
-    'HouseholdIncome': {**{i: f'Income decile {i}' for i in range(1, 11)}},
-    'EmploymentStatus': {1: 'Employee', 2: 'Self-employed', 3: 'Family business', 6: 'Not applicable'},
-    'TradeUnionMember': {1: 'Yes, currently', 2: 'Yes, previously', 3: 'No'},
-    'PoliticalInterest': {1: 'Very interestd', 2: 'Quite interested', 3: 'Hardly interested', 4: 'Not at all interested'},
-    'LeftRightScale': {0: 'Left', **{i: f'Position {i}' for i in range(1, 10)}, 10: 'Right'},
-    'SatisfactionDemocracy': {0: 'Extremely dissatisfied', **{i: f'Level {i}' for i in range(1, 10)}, 10: 'Extremely satisfied'},
-    'TrustEP': {0: 'No trust', **{i: f'Level {i}' for i in range(1, 10)}, 10: 'Complete trust'},
-    'Religion': {0: 'Not at all', **{i: f'Position {i}' for i in range(1, 10)}, 10: 'Very Religious'},
-    'ZeroPayGapOpinion': {0: 'Very bad for Economy', **{i: f'Level {i}' for i in range(1, 6)}, 6: 'Very good for Economy'},
-    'AttitudeTowardLGBT': {1: 'Strongly agree', 2: 'Agree', 3: 'Neutral', 4: 'Disagree', 5: 'Strongly disagree'},
-    'VotedCoalition': {1: 'CSX', 2: 'M5S', 3: 'TerzoPolo', 4: "CDX"},
-    'AttitudesTowardImmigration': {0: 'Imm. makes place worse', **{i: f'Level {i}' for i in range(1, 10)}, 10: 'Imm. makes place better'},
-}
+# We save the cleaned dataset in parquet (columnar and compressed, it keeps the dtypes above):
+# the Machine Learning section can be re-run from it, without parsing and filtering the csv again
+df_filtered.to_parquet('ESS11_clean.parquet', compression='zstd')
 
 """# Summary Statistics
 
@@ -283,22 +317,19 @@ markdown_table
 In the following part, a correlation matrix is drawn, presenting eyeballing correlations among our considered variables.
 """
 
-import matplotlib.pyplot as plt
-import seaborn as sns
-from sklearn.preprocessing import LabelEncoder
-
-df_final = df_filtered.copy()
-df_final = df_final.drop(columns=['VotedParty'])
+# drop returns a new dataframe, so no explicit copy of df_filtered is needed
+df_final = df_filtered.drop(columns=['VotedParty'])
 
-# Identify categorical columns and apply label encoding
+# Identify categorical columns (i.e. Region) and apply label encoding, with the sorted codes of pd.factorize
 categorical_cols = df_final.select_dtypes(include=['object', 'category']).columns
 
-label_encoder = LabelEncoder()
-for col in categorical_cols:
-    df_final[col] = label_encoder.fit_transform(df_final[col])
+if len(categorical_cols):
+    df_final[categorical_cols] = df_final[categorical_cols].apply(lambda s: pd.factorize(s, sort=True)[0])
 
-# Calculate the correlation matrix and plot it
-correlation_matrix = df_final.corr()
+# Calculate the correlation matrix and plot it. No missing values are left, so we compute it
+# with np.corrcoef on a float32 array (enough for a 2-decimals display) rather than pairwise with df.corr()
+correlation_matrix = np.corrcoef(df_final.to_numpy(dtype=np.float32), rowvar=False)
+correlation_matrix = pd.DataFrame(correlation_matrix, index=df_final.columns, columns=df_final.columns)
 
 plt.figure(figsize=(12, 10))
 sns.heatmap(correlation_matrix, annot=True, cmap='coolwarm', fmt=".2f")
@@ -311,58 +342,47 @@ In this part we run two bivariate analysis, between our outcome variable (VotedC
 The first analysis is with the variable AttitudesTowardImmigration: believing that immigrates makes the place where you live worse is consistently correlated with voting for the Center-Right coalition.
 """
 
-# Group data to get count of each combination of 'AttitudesTowardImmigration' and 'VotedCoalition'
-df_counts = df_final.groupby(['AttitudesTowardImmigration', 'VotedCoalition']).size().reset_index(name='count')
+# Count each combination of 'AttitudesTowardImmigration' and 'VotedCoalition' on the full 11x4 grid:
+# we pack the two codes into a single integer key and count the keys with np.bincount
+key = (df_final['VotedCoalition'].to_numpy(dtype=np.int64) - 1) * 11 + df_final['AttitudesTowardImmigration'].to_numpy(dtype=np.int64)
+counts = pd.DataFrame(np.bincount(key, minlength=44).reshape(4, 11), index=range(1, 5), columns=range(11))
 
-# Create the scatter plot with varying point sizes based on density (count)
+# Plot the counts as a heatmap (density of each combination), with coalitions from bottom to top
 plt.figure(figsize=(10, 6))
-sns.scatterplot(
-    x='AttitudesTowardImmigration',
-    y='VotedCoalition',
-    data=df_counts,
-    size='count',
-    sizes=(20, 200),
-    alpha=0.7,
-    hue='VotedCoalition',
-    palette='viridis'
-)
+ax = sns.heatmap(counts, annot=True, fmt='d', cmap='viridis', cbar_kws={'label': 'count'})
+ax.invert_yaxis()
 
-# Add a regression line
-sns.regplot(x='AttitudesTowardImmigration', y='VotedCoalition', data=df_final, scatter=False, color='red')
+# Add a regression line (heatmap cells are centered at +0.5)
+slope, intercept = np.polyfit(df_final['AttitudesTowardImmigration'].to_numpy(dtype=float), df_final['VotedCoalition'].to_numpy(dtype=float), 1)
+ax.plot(np.arange(11) + 0.5, slope * np.arange(11) + intercept - 0.5, color='red')
 
 # Set the axis labels and apply label_names for AttitudesTowardImmigration and VotedCoalition
 plt.xlabel("Attitudes toward immigration")
 plt.ylabel("Coalition voted for")
 
-plt.xticks(ticks=range(11), labels=[label_names['AttitudesTowardImmigration'].get(i, i) for i in range(11)], rotation=45)
-plt.yticks(ticks=range(1, 5), labels=[label_names['VotedCoalition'].get(i, i) for i in range(1, 5)], rotation=45)
+plt.xticks(ticks=np.arange(11) + 0.5, labels=[label_names['AttitudesTowardImmigration'].get(i, i) for i in range(11)], rotation=45)
+plt.yticks(ticks=np.arange(4) + 0.5, labels=[label_names['VotedCoalition'].get(i, i) for i in range(1, 5)], rotation=45)
 
 plt.show()
 
 """The second bivariate analysis substitutes AttitudesTowardImmigration with SatisfactionDemocracy: higher levels of satisfaction with democracy are correlated with voting for the Center-Right coalition. However, overall the mass of votes seems to be mainly spread in the centered values for all the coalitions."""
 
 # You may check the previous chunk for the commented code
-df_counts = df_final.groupby(['SatisfactionDemocracy', 'VotedCoalition']).size().reset_index(name='count')
+key = (df_final['VotedCoalition'].to_numpy(dtype=np.int64) - 1) * 11 + df_final['SatisfactionDemocracy'].to_numpy(dtype=np.int64)
+counts = pd.DataFrame(np.bincount(key, minlength=44).reshape(4, 11), index=range(1, 5), columns=range(11))
 
 plt.figure(figsize=(10, 6))
-sns.scatterplot(
-    x='SatisfactionDemocracy',
-    y='VotedCoalition',
-    data=df_counts,
-    size='count',
-    sizes=(20, 200),
-    alpha=0.7,
-    hue='VotedCoalition',
-    palette='viridis'
-)
+ax = sns.heatmap(counts, annot=True, fmt='d', cmap='viridis', cbar_kws={'label': 'count'})
+ax.invert_yaxis()
 
-sns.regplot(x='SatisfactionDemocracy', y='VotedCoalition', data=df_final, scatter=False, color='red')
+slope, intercept = np.polyfit(df_final['SatisfactionDemocracy'].to_numpy(dtype=float), df_final['VotedCoalition'].to_numpy(dtype=float), 1)
+ax.plot(np.arange(11) + 0.5, slope * np.arange(11) + intercept - 0.5, color='red')
 
 plt.xlabel("Satisfaction with Democracy")
 plt.ylabel("Coalition voted for")
 
-plt.xticks(ticks=range(11), labels=[label_names['SatisfactionDemocracy'].get(i, i) for i in range(11)], rotation=45)
-plt.yticks(ticks=range(1, 5), labels=[label_names['VotedCoalition'].get(i, i) for i in range(1, 5)], rotation=45)
+plt.xticks(ticks=np.arange(11) + 0.5, labels=[label_names['SatisfactionDemocracy'].get(i, i) for i in range(11)], rotation=45)
+plt.yticks(ticks=np.arange(4) + 0.5, labels=[label_names['VotedCoalition'].get(i, i) for i in range(1, 5)], rotation=45)
 
 plt.show()
 
@@ -371,12 +391,18 @@ plt.show()
 In the following part we focused on the univariate analysis of the variables involved, with an individuals focus on the outcome variable and then an aggregated analysis of the other variables.
 """
 
-# Countplot for outcome variable 'VotedCoalition'
+# Countplot for outcome variable 'VotedCoalition': the marginal counts are computed once (single hash pass, no sort by frequency)
+coalition_counts = df_final['VotedCoalition'].value_counts(sort=False).sort_index()
+
 plt.figure(figsize=(10, 6))
-ax = sns.countplot(x='VotedCoalition', data=df_final, palette = "viridis")
+ax = plt.gca()
+ax.bar(np.arange(len(coalition_counts)), coalition_counts.to_numpy(), color=sns.color_palette("viridis", len(coalition_counts)))
+ax.set_xlabel('VotedCoalition')
+ax.set_ylabel('count')
 
 # Set custom x-axis labels using the label_names dictionary
-ax.set_xticklabels([label_names['VotedCoalition'].get(int(label.get_text()), label.get_text()) for label in ax.get_xticklabels()], rotation=45, ha='right')
+ax.set_xticks(np.arange(len(coalition_counts)))
+ax.set_xticklabels([label_names['VotedCoalition'].get(c, c) for c in coalition_counts.index], rotation=45, ha='right')
 
 plt.title('Frequency of Voted Coalition')
 plt.show()
@@ -417,14 +443,18 @@ rows = -(-num_vars // cols)
 fig, axes = plt.subplots(rows, cols, figsize=(cols * 6, rows * 5))
 axes = axes.flatten()
 
-# Plot bar charts for categorical variables
+# Sorted categories of each variable, computed once (no missing values are left in df_final)
+orders = {var: np.unique(df_final[var].to_numpy()) for var in barplot_vars}
+
+# Plot bar charts for categorical variables: counts are computed once with np.bincount and drawn directly with ax.bar
 for i, var in enumerate(barplot_vars):
     ax = axes[i]
-    sns.countplot(x=var, data=df_final, ax=ax, order=sorted(df_final[var].dropna().unique()))
+    counts = np.bincount(df_final[var].to_numpy(dtype=np.int64))
+    ax.bar(np.arange(len(orders[var])), counts[orders[var]])
 
     # Set correct x-axis labels using the label_names dictionary
-    ax.set_xticklabels([label_names[var].get(int(label.get_text()), label.get_text())
-                        for label in ax.get_xticklabels()], rotation=45, ha='right')
+    ax.set_xticks(np.arange(len(orders[var])))
+    ax.set_xticklabels([label_names[var].get(int(c), c) for c in orders[var]], rotation=45, ha='right')
 
     ax.set_title(f"Distribution of {var}", fontsize=12)
     ax.set_xlabel(f"{var}", fontsize=12)
@@ -451,9 +481,9 @@ for k in range(num_vars, len(axes)):
 # Adjust layout and display
 plt.tight_layout()
 
-# Create a separate plot for VotedCoalition
+# Create a separate plot for VotedCoalition (counts computed above)
 plt.figure(figsize=(8, 6))
-sns.countplot(x=voted_coalition_var, data=df_final)
+plt.bar(np.arange(len(coalition_counts)), coalition_counts.to_numpy())
 plt.title("Distribution of VotedCoalition", fontsize=14)
 plt.xlabel("Voted Coalition", fontsize=12)
 plt.ylabel("Count", fontsize=12)
@@ -487,6 +517,14 @@ In this section we perform all the relevant machine learning and regression anal
 We plot the density distribution of vote for each coalition on the Left-Right scale. Since our variable of interest Left-Right Scale is discrete, we initially proceed with a boxen plot.
 """
 
+# When the previous sections were skipped (after the first cells, with the imports and the labels), df_final is rebuilt
+# as in the Correlation part from the cleaned dataset saved in the Data Wrangling section, without the csv
+if 'df_final' not in globals():
+    df_final = pd.read_parquet('ESS11_clean.parquet').drop(columns=['VotedParty'])
+    categorical_cols = df_final.select_dtypes(include=['object', 'category']).columns
+    if len(categorical_cols):
+        df_final[categorical_cols] = df_final[categorical_cols].apply(lambda s: pd.factorize(s, sort=True)[0])
+
 import matplotlib.patches as mpatches
 
 plt.figure(figsize=(10, 6))
@@ -521,25 +559,24 @@ plt.show()
 plt.figure(figsize=(10, 6))
 custom_palette = {1: 'red', 2: 'yellow', 3: 'green', 4: 'blue'}
 
-# Loops for the lines plot
-for coalition in df_final['VotedCoalition'].unique():
-  df_coalition = df_final[df_final['VotedCoalition'] == coalition]
-
-  sns.kdeplot(
-      df_coalition['LeftRightScale'],
-      label=label_names['VotedCoalition'].get(coalition, coalition),
-      color=custom_palette.get(coalition),
-      #bw_adjust=0.8,
-      #fill=True,
-      #cut=0,
-  )
+# A single call for the lines plot, one line per coalition (hue), each normalised separately (common_norm=False)
+sns.kdeplot(
+    data=df_final,
+    x='LeftRightScale',
+    hue=df_final['VotedCoalition'].map(label_names['VotedCoalition']),
+    hue_order=[label_names['VotedCoalition'][k] for k in sorted(custom_palette)],
+    palette={label_names['VotedCoalition'][k]: color for k, color in custom_palette.items()},
+    common_norm=False,
+    #bw_adjust=0.8,
+    #fill=True,
+    #cut=0,
+)
 
-# Set the plot, axis labels and title, legend
+# Set the plot, axis labels and title (the legend is drawn by seaborn)
 plt.xlabel('Left-Right Scale')
 plt.ylabel('Density')
 plt.title('Distribution of Left-Right Scale by Voted Coalition')
 plt.xlim(0, 10)
-plt.legend()
 
 
 plt.show()
@@ -580,21 +617,74 @@ The very first analysis is carried out on the raw data: we divide the sample in
 # Import necessary packages for analyses
 import matplotlib.gridspec as gridspec
 from sklearn.tree import DecisionTreeClassifier, plot_tree
-from sklearn.metrics import accuracy_score, classification_report, confusion_matrix, ConfusionMatrixDisplay
+from sklearn.metrics import confusion_matrix, ConfusionMatrixDisplay
 from sklearn.model_selection import train_test_split, RandomizedSearchCV, StratifiedKFold, GridSearchCV, cross_val_score
-from sklearn.ensemble import RandomForestClassifier
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401 (enables the successive halving searches below)
+from sklearn.model_selection import HalvingGridSearchCV, HalvingRandomSearchCV
+from scipy.stats import loguniform, randint
+from sklearn.ensemble import RandomForestClassifier, HistGradientBoostingClassifier
+from sklearn.inspection import permutation_importance
 from sklearn.linear_model import LogisticRegression
 from sklearn.preprocessing import StandardScaler
-from sklearn.pipeline import Pipeline as ImbPipeline
-from imblearn.over_sampling import SMOTE, RandomOverSampler
+from imblearn.pipeline import Pipeline as ImbPipeline
+from imblearn.over_sampling import RandomOverSampler
+from imblearn.ensemble import BalancedRandomForestClassifier
+from sklearn.utils.class_weight import compute_sample_weight
+from joblib import Memory
 import xgboost as xgb
 import statsmodels.api as sm
 
+# On-disk cache of the resampling steps of the pipelines: within a search, the oversampled training set of each fold is
+# computed once and reused by all the hyperparameter candidates (the resampling does not depend on them)
+mem = Memory('./cv_cache', verbose=0)
+# The cache keys hash the resampling functions by name, not by body: the cache of a previous session is cleared, so that
+# an edit of those functions is never hidden by stale resampled folds
+mem.clear(warn=False)
+
+# Evaluation metrics derived from a single confusion matrix (rows: true labels, columns: predicted labels), instead of
+# letting accuracy_score, confusion_matrix and classification_report each recount the predictions
+def eval_from_cm(y_true, y_pred, labels):
+    cm = confusion_matrix(y_true, y_pred, labels=labels)
+    tp = np.diag(cm)
+    support = cm.sum(axis=1)
+    pred_pos = cm.sum(axis=0)
+    precision = tp / np.maximum(pred_pos, 1)
+    recall = tp / np.maximum(support, 1)
+    f1 = 2 * precision * recall / np.maximum(precision + recall, 1e-12)
+    acc = tp.sum() / cm.sum()
+    return cm, acc, precision, recall, f1, support
+
+# Feature importances as a Series sorted in decreasing order: printed and, if PLOT, drawn as a bar chart
+def plot_importances(importances, feature_names, title):
+    s = pd.Series(importances, index=feature_names).sort_values(ascending=False)
+    print("\nFeature Importance:")
+    print(s)
+    if PLOT:
+        ax = s.plot.bar(figsize=(12, 6))
+        ax.set_xlabel('Features')
+        ax.set_ylabel('Importance')
+        ax.set_title(title)
+        plt.tight_layout()
+        plt.show()
+    return s
+
+# Confusion matrix drawn (if PLOT) from the matrix already computed, with matplotlib's imshow
+def plot_cm(cm, labels, title):
+    if PLOT:
+        ConfusionMatrixDisplay(cm, display_labels=labels).plot(cmap='Blues', colorbar=False)
+        plt.title(title)
+        plt.show()
+
 X = df_final.drop('VotedCoalition', axis=1)
 y = df_final['VotedCoalition']
 
+# We train on contiguous float32/int32 arrays (float32 is the dtype used internally by sklearn trees), keeping the feature names aside
+feature_names = X.columns.tolist()
+X_np = X.to_numpy(dtype=np.float32)
+y_np = y.to_numpy(dtype=np.int32)
+
 # Split data into training and testing sets, with a composition of 80/20
-X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=60)
+X_train, X_test, y_train, y_test = train_test_split(X_np, y_np, test_size=0.2, random_state=60)
 
 # Initialization of the Classifier: Decision Tree
 clf = DecisionTreeClassifier()
@@ -605,8 +695,8 @@ clf.fit(X_train, y_train)
 # Make predictions on the test set
 y_pred = clf.predict(X_test)
 
-# Evaluate the model's accuracy
-accuracy = accuracy_score(y_test, y_pred)
+# Evaluate the model's accuracy (and per-class scores) from a single confusion matrix
+cm, accuracy, precision, recall, f1, support = eval_from_cm(y_test, y_pred, labels=clf.classes_)
 print(f"Test Accuracy: {accuracy}")
 
 
@@ -614,7 +704,7 @@ print(f"Test Accuracy: {accuracy}")
 y_train_pred = clf.predict(X_train)
 
 # Evaluate the model's accuracy on the training set
-train_accuracy = accuracy_score(y_train, y_train_pred)
+train_accuracy = eval_from_cm(y_train, y_train_pred, labels=clf.classes_)[1]
 print(f"Training Accuracy: {train_accuracy}")
 
 """It is normal for a model to perform better on the training set than on the test set because the model has seen the training data during training and has learned to make predictions on it. However, a large difference in performance between the training set and the test set can indicate overfitting.
@@ -632,38 +722,39 @@ clf = DecisionTreeClassifier(max_depth=5, min_samples_split=10, min_samples_leaf
 
 clf.fit(X_train, y_train)
 
-# Map target class values to more readable names
-target_names = {4: 'CDX', 1: 'CSX', 2: 'M5S', 3: '3POLO'}
-y_train_mapped = y_train.map(target_names)
-y_test_mapped = y_test.map(target_names)
+# Map target class values to more readable names, with a lookup table indexed by the coalition codes (index 0 unused)
+label_lut = np.array(['', 'CSX', 'M5S', '3POLO', 'CDX'])
+y_train_mapped = label_lut[y_train]
+y_test_mapped = label_lut[y_test]
 
 
 # Plot
-plt.figure(figsize=(20, 10))
-plot_tree(clf,
-          feature_names=X_train.columns,  # Use column names for feature names
-          class_names=list(target_names.values()), # Use target names for class names
-          filled=True,  # Fill nodes with colors
-          rounded=True, # Rounded boxes
-          fontsize=8,  # Adjust fontsize
-          max_depth=5) # Set the max depth
-
-plt.show()
+if PLOT:
+    plt.figure(figsize=(20, 10))
+    plot_tree(clf,
+              feature_names=feature_names,  # Use column names for feature names
+              class_names=label_lut[clf.classes_].tolist(), # Use target names for class names
+              filled=True,  # Fill nodes with colors
+              rounded=True, # Rounded boxes
+              fontsize=8,  # Adjust fontsize
+              max_depth=5) # Set the max depth
+    plt.show()
 
 # Minimal Confusion Matrix
-print("Confusion Matrix:\n", confusion_matrix(y_test, y_pred))
-print("Classification Report:\n", classification_report(y_test, y_pred))
+print("Confusion Matrix:\n", cm)
+print("Classification Report:\n",
+      pd.DataFrame({'precision': precision, 'recall': recall, 'f1-score': f1, 'support': support}, index=label_lut[1:]).round(2))
 
 """Now we try to improve the Classifier, for example by **stratifying the samples**. It guarantees that the relative frequencies of each class in the original dataset are reflected in the splits. For example, if one coalition received more votes than others, both the training and test sets will have a similar imbalance. Without stratification, there's a risk that the train or test split might end up with an uneven class distribution, which could lead to biased training or misleading evaluation results.
 
 This makes sure that the two samples training and test are representative of the original dataset, based on characteristics.
 """
 
-X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=60, stratify=y)
+X_train, X_test, y_train, y_test = train_test_split(X_np, y_np, test_size=0.2, random_state=60, stratify=y_np)
 
 # Map target values to names for better readability
-y_train_mapped = y_train.map(target_names)
-y_test_mapped = y_test.map(target_names)
+y_train_mapped = label_lut[y_train]
+y_test_mapped = label_lut[y_test]
 
 clf = DecisionTreeClassifier(max_depth=4,
                              min_samples_split=10,
@@ -674,27 +765,29 @@ clf.fit(X_train, y_train)
 y_pred = clf.predict(X_test)
 
 # Evaluate test accuracy
-test_accuracy = accuracy_score(y_test, y_pred)
+cm, test_accuracy, precision, recall, f1, support = eval_from_cm(y_test, y_pred, labels=clf.classes_)
 print(f"Test Accuracy: {test_accuracy:.4f}")
 
 # Evaluate training accuracy
 y_train_pred = clf.predict(X_train)
-train_accuracy = accuracy_score(y_train, y_train_pred)
+train_accuracy = eval_from_cm(y_train, y_train_pred, labels=clf.classes_)[1]
 print(f"Training Accuracy: {train_accuracy:.4f}")
 
 
 # Print Confusion Matrix and Classification Report (using original labels)
-print("Confusion Matrix:\n", confusion_matrix(y_test, y_pred))
-print("Classification Report:\n", classification_report(y_test, y_pred, target_names=[target_names[c] for c in sorted(target_names.keys())]))
+print("Confusion Matrix:\n", cm)
+print("Classification Report:\n",
+      pd.DataFrame({'precision': precision, 'recall': recall, 'f1-score': f1, 'support': support}, index=label_lut[1:]).round(2))
 
 
 # Decision Tree plot
-plt.figure(figsize=(20, 10))
-class_names = [target_names[c] for c in clf.classes_]
-plot_tree(clf, feature_names=X.columns, class_names=class_names,
-          filled=True, rounded=True, fontsize=10)
-plt.title("Decision Tree")
-plt.show()
+class_names = label_lut[clf.classes_].tolist()
+if PLOT:
+    plt.figure(figsize=(20, 10))
+    plot_tree(clf, feature_names=feature_names, class_names=class_names,
+              filled=True, rounded=True, fontsize=10)
+    plt.title("Decision Tree")
+    plt.show()
 
 """The discrepancy in accuracy between training and test is now lower, because the training is now more generalised and the potential overfitting is reduced.
 
@@ -703,7 +796,6 @@ A second problem that we have to address is the fact that LeftRightScale is clea
 
 # Create a new dataset without LeftRightScale
 df_final2 = df_final.drop('LeftRightScale', axis=1)
-target_names = {4: 'CDX', 1: 'CSX', 2: 'M5S', 3: '3POLO'}
 
 X = df_final2.drop('VotedCoalition', axis=1)
 y = df_final2['VotedCoalition']
@@ -712,8 +804,8 @@ y = df_final2['VotedCoalition']
 X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=60, stratify=y)
 
 # Map target values to names for readability
-y_train_mapped = y_train.map(target_names)
-y_test_mapped = y_test.map(target_names)
+y_train_mapped = label_lut[y_train.to_numpy()]
+y_test_mapped = label_lut[y_test.to_numpy()]
 
 # Initialize Decision Tree Classifier with hyperparameters
 clf = DecisionTreeClassifier(max_depth=4,
@@ -726,34 +818,36 @@ clf.fit(X_train, y_train)
 y_pred = clf.predict(X_test)
 
 # Test accuracy
-test_accuracy = accuracy_score(y_test, y_pred)
+cm, test_accuracy, precision, recall, f1, support = eval_from_cm(y_test, y_pred, labels=clf.classes_)
 print(f"Test Accuracy: {test_accuracy:.4f}")
 
 # Training accuracy
 y_train_pred = clf.predict(X_train)
-train_accuracy = accuracy_score(y_train, y_train_pred)
+train_accuracy = eval_from_cm(y_train, y_train_pred, labels=clf.classes_)[1]
 print(f"Training Accuracy: {train_accuracy:.4f}")
 
 
 # Print Confusion Matrix and Classification Report (using original labels)
-print("Confusion Matrix:\n", confusion_matrix(y_test, y_pred))
-print("Classification Report:\n", classification_report(y_test, y_pred, target_names=[target_names[c] for c in sorted(target_names.keys())]))
+print("Confusion Matrix:\n", cm)
+print("Classification Report:\n",
+      pd.DataFrame({'precision': precision, 'recall': recall, 'f1-score': f1, 'support': support}, index=label_lut[1:]).round(2))
 
 # Decision Tree Plot
-plt.figure(figsize=(20, 10))
-class_names = [target_names[c] for c in clf.classes_]
-plot_tree(clf, feature_names=X.columns, class_names=class_names,
-          filled=True, rounded=True, fontsize=10)
-plt.title("Decision Tree")
-plt.show()
+class_names = label_lut[clf.classes_].tolist()
+if PLOT:
+    plt.figure(figsize=(20, 10))
+    plot_tree(clf, feature_names=X.columns, class_names=class_names,
+              filled=True, rounded=True, fontsize=10)
+    plt.title("Decision Tree")
+    plt.show()
 
 """After having addressed the stratification issue (to ensure representativeness in both training and test sets) and having removed LeftRightScale from the model, we focus on two additional issues:
 1. Imbalanced classes: Given the distribution of votes (outcome variable, Party Voted) observed in the descriptive statistics above, the amount of votes for CSX and CDX coalitions is disproportionately higher, while we observe few votes for 3POLO and M5S. Consequently, we address this imbalance with 3 methods:
-  * SMOTE (Synthetic Minority Over-sampling Technique).
+  * SMOTE (Synthetic Minority Over-sampling Technique). In the Decision Tree, Random Forest and XG Boost models it is replaced by class-balanced sample weights, which give each class the same total weight without enlarging the training set (the SMOTE resampling is left, commented, as an alternative).
   * Bootstrapping.
   * Weighted random forests. \\
   Note that we apply these methodologies only to the training set, and not to the test one, otherwise our test would be carried out on a synthetic (not-real) set, and the metrics (F1, accuracy) would be inflated.
-2. Several Hyperparameters to be selected: given that in our models several hyperparameters have to be selected, we take advantage of Cross-Validation methods. After performing several combinations, they select the best one. After trying both Grid Search and Random Search and getting similar results, we opted for the former one, more exhaustive. However, in your implementation you can easily switch to RandomSearch.
+2. Several Hyperparameters to be selected: given that in our models several hyperparameters have to be selected, we take advantage of Cross-Validation methods. After performing several combinations, they select the best one. After trying both Grid Search and Random Search and getting similar results, we opted for the former one, more exhaustive. However, in your implementation you can easily switch to RandomSearch. To contain the computational cost, the grid searches of the Decision Tree and Random Forest models are run with successive halving (HalvingGridSearchCV): all the candidates of the grid are evaluated on a small budget (a subsample of the training set, or a small number of trees), and only the best ones are evaluated on larger budgets. For the largest grid (the first XG Boost model) we sample 30 random candidates instead of evaluating all of the combinations, each on the whole training set.
 
 To understand better the first problem, we realize a Base Decision Tree, without any of the oversampling/balancing methods. Also, we still do not use Cross-Validation.
 """
@@ -761,7 +855,15 @@ To understand better the first problem, we realize a Base Decision Tree, without
 X = df_final2.drop('VotedCoalition', axis=1)
 y = df_final2['VotedCoalition']
 
+# As above, all the following models are trained on contiguous float32/int32 arrays (converted once, instead of at every fit
+# of the searches), keeping the feature names aside
+feature_names = X.columns.tolist()
+X = np.ascontiguousarray(X.to_numpy(dtype=np.float32))
+y = y.to_numpy(dtype=np.int32)
+
+# Single stratified train/test split (80/20) and stratified 5-fold cross-validation, shared by all the following models
 X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)
+cv = StratifiedKFold(n_splits=5, shuffle=True, random_state=42)
 
 clf = DecisionTreeClassifier(random_state=42, max_depth = 4)
 clf.fit(X_train, y_train)
@@ -769,92 +871,48 @@ clf.fit(X_train, y_train)
 y_pred = clf.predict(X_test)
 
 # Evaluate the model
-accuracy = accuracy_score(y_test, y_pred)
+cm, accuracy, precision, recall, f1, support = eval_from_cm(y_test, y_pred, labels=clf.classes_)
 print(f"Decision Tree Accuracy: {accuracy}")
 
 # Plot the decision tree
-plt.figure(figsize=(20, 10))
-
-class_names = [target_names[c] for c in clf.classes_]
-plot_tree(clf, feature_names=X.columns, class_names=class_names,
-          filled=True, rounded=True, fontsize=8)
-plt.title("Decision Tree")
-plt.show()
+class_names = label_lut[clf.classes_].tolist()
+if PLOT:
+    plt.figure(figsize=(20, 10))
+    plot_tree(clf, feature_names=feature_names, class_names=class_names,
+              filled=True, rounded=True, fontsize=8)
+    plt.title("Decision Tree")
+    plt.show()
 
 
 #Plot Confusion Matrix
-cm = confusion_matrix(y_test, y_pred)
-plt.figure(figsize=(8, 6))
-sns.heatmap(cm, annot=True, fmt="d", cmap="Blues", cbar=False,
-            xticklabels=class_names,
-            yticklabels=class_names)
-plt.xlabel("Predicted Label")
-plt.ylabel("True Label")
-plt.title("Confusion Matrix")
-plt.show()
+plot_cm(cm, class_names, "Confusion Matrix")
 
 """We observe that the accuracy is pretty good, but the model performs very poorly for the two minority classes. Indeed, the accuracy is driven by the two biggest classes: the model simply predicts those two classes for most observations, also for those belonging to the coalitions in the middle (minority classes).
 
 Now we apply Cross-validation and Oversampling methods.
 
-1) Decision Tree with Cross-validation + SMOTE
-"""
+1) Decision Tree with Cross-validation + balanced sample weights (in place of SMOTE), with both Grid Search and Random Search to compare performance.
 
-X_train, X_test, y_train, y_test = train_test_split(
-    X, y, test_size=0.2, random_state=42, stratify=y
-)
+2) Decision Tree with Cross-validation + Bootstrapping.
 
-# Apply SMOTE only to the training data
-smote = SMOTE(random_state=42)
-X_train_resampled, y_train_resampled = smote.fit_resample(X_train, y_train)
+The three models share the same training and test sets and the same cross-validation folds, and are fitted in a single loop.
+"""
 
-# Initialize and train the Decision Tree classifier with GridSearchCV
+# Class-balanced sample weights instead of SMOTE: each class gets the same total weight, without inflating the training
+# set with synthetic observations (the search splits the weights along with the folds)
+sw = compute_sample_weight('balanced', y_train)
+# Alternative: SMOTE (from imblearn.over_sampling) as the first step of a pipeline, so that it is applied to each
+# training fold only (and not to the validation folds), e.g.
+# ImbPipeline([('smote', SMOTE(random_state=42)), ('clf', ...)], memory=mem)
+
+# Parameter grid for HalvingGridSearchCV (successive halving: same candidates, the weakest ones are discarded on small
+# subsamples and only the best ones are evaluated on the full training set)
 param_grid = {
     'max_depth': [3, 4, 5, 6],
     'min_samples_split': [5, 10, 15],
     'min_samples_leaf': [3, 5, 7]
 }
 
-clf = DecisionTreeClassifier(random_state=42)
-grid_search = GridSearchCV(clf, param_grid, cv=5, scoring='accuracy')
-grid_search.fit(X_train_resampled, y_train_resampled)
-
-print("Best Hyperparameters:", grid_search.best_params_)
-
-# Evaluate the best model
-best_clf = grid_search.best_estimator_
-y_pred = best_clf.predict(X_test)
-accuracy = accuracy_score(y_test, y_pred)
-print(f"Decision Tree Accuracy (with GridSearchCV and SMOTE on training set only): {accuracy}")
-
-# Plot the decision tree
-plt.figure(figsize=(20, 10))
-plot_tree(best_clf, feature_names=X.columns, class_names=class_names,
-          filled=True, rounded=True, fontsize=8)
-plt.show()
-
-# Plot Confusion Matrix
-cm = confusion_matrix(y_test, y_pred)
-plt.figure(figsize=(8, 6))
-sns.heatmap(cm, annot=True, fmt="d", cmap="Blues", cbar=False,
-            xticklabels=class_names,
-            yticklabels=class_names)
-plt.xlabel("Predicted Label")
-plt.ylabel("True Label")
-plt.title("Confusion Matrix")
-plt.show()
-
-print(classification_report(y_test, y_pred))
-
-"""Here, same approach but using Random Search for cross-validation, to compare performance."""
-
-X_train, X_test, y_train, y_test = train_test_split(
-    X, y, test_size=0.2, random_state=42, stratify=y
-)
-
-smote = SMOTE(random_state=42)
-X_train_resampled, y_train_resampled = smote.fit_resample(X_train, y_train)
-
 # Define the parameter grid for RandomizedSearchCV
 param_dist = {
     'max_depth': [3, 4, 5, 6],
@@ -865,86 +923,57 @@ param_dist = {
     'splitter': ['best', 'random']
 }
 
-clf = DecisionTreeClassifier(random_state=42)
-
-random_search = RandomizedSearchCV(clf, param_distributions=param_dist, n_iter=50, cv=5, scoring='accuracy', random_state=60, n_jobs=-1)
-random_search.fit(X_train_resampled, y_train_resampled)
-
-print("Best Hyperparameters:", random_search.best_params_)
-
-# Evaluate the best model
-best_clf = random_search.best_estimator_
-y_pred = best_clf.predict(X_test)
-accuracy = accuracy_score(y_test, y_pred)
-print(f"Decision Tree Accuracy (with GridSearchCV and SMOTE on training set only): {accuracy}")
-
-# Plot the decision tree
-plt.figure(figsize=(20, 10))
-plot_tree(best_clf, feature_names=X.columns, class_names=class_names,
-          filled=True, rounded=True, fontsize=8)
-plt.show()
-
-# Plot Confusion Matrix
-cm = confusion_matrix(y_test, y_pred)
-plt.figure(figsize=(8, 6))
-sns.heatmap(cm, annot=True, fmt="d", cmap="Blues", cbar=False,
-            xticklabels=class_names,
-            yticklabels=class_names)
-plt.xlabel("Predicted Label")
-plt.ylabel("True Label")
-plt.title("Confusion Matrix")
-plt.show()
-
-
-print(classification_report(y_test, y_pred))
-
-"""2) Decision Tree with Cross-validation + Bootstrapping"""
-
-X_train, X_test, y_train, y_test = train_test_split(
-    X, y, test_size=0.2, random_state=42, stratify=y
-)
-
-# Apply bootstrapping using RandomOverSampler only to the training set
-ros = RandomOverSampler(random_state=42)
-X_train_resampled, y_train_resampled = ros.fit_resample(X_train, y_train)
-
-param_grid = {
-    'max_depth': [3, 4, 5, 6],
-    'min_samples_split': [5, 10, 15, 20],
-    'min_samples_leaf': [3, 5, 7, 9]
+# Bootstrapping with RandomOverSampler as the first step of a pipeline, so that it is applied to the training folds only
+boot_pipeline = ImbPipeline([
+    ('ros', RandomOverSampler(random_state=42)),
+    ('clf', DecisionTreeClassifier(random_state=42))
+], memory=mem)
+boot_param_grid = {
+    'clf__max_depth': [3, 4, 5, 6],
+    'clf__min_samples_split': [5, 10, 15, 20],
+    'clf__min_samples_leaf': [3, 5, 7, 9]
 }
 
-clf = DecisionTreeClassifier(random_state=42)
-grid_search = GridSearchCV(clf, param_grid, cv=5, scoring='accuracy')
-grid_search.fit(X_train_resampled, y_train_resampled)
-
-best_clf = grid_search.best_estimator_
-y_pred = best_clf.predict(X_test)
-
-print("Best Hyperparameters:", grid_search.best_params_)
-
-# Evaluate the model
-accuracy = accuracy_score(y_test, y_pred)
-print(f"Decision Tree Accuracy (with GridSearchCV and Bootstrapping on training set only): {accuracy}")
-
-# Plot the decision tree
-plt.figure(figsize=(20, 10))
-plot_tree(best_clf, feature_names=X.columns, class_names=class_names,
-          filled=True, rounded=True, fontsize=8)
-plt.show()
-
-# Plot Confusion Matrix
-cm = confusion_matrix(y_test, y_pred)
-plt.figure(figsize=(8, 6))
-sns.heatmap(cm, annot=True, fmt="d", cmap="Blues", cbar=False,
-            xticklabels=class_names,
-            yticklabels=class_names)
-plt.xlabel("Predicted Label")
-plt.ylabel("True Label")
-plt.title("Confusion Matrix")
-plt.show()
-
-print(classification_report(y_test, y_pred))
+# (description, search, fit parameters) of each model
+dt_candidates = [
+    ('HalvingGridSearchCV and balanced sample weights',
+     HalvingGridSearchCV(DecisionTreeClassifier(random_state=42), param_grid, factor=3, resource='n_samples',
+                         min_resources='exhaust', cv=cv, scoring='accuracy', n_jobs=-1, random_state=42),
+     {'sample_weight': sw}),
+    ('RandomizedSearchCV and balanced sample weights',
+     RandomizedSearchCV(DecisionTreeClassifier(random_state=42), param_distributions=param_dist, n_iter=50, cv=cv,
+                        scoring='accuracy', random_state=60, n_jobs=-1),
+     {'sample_weight': sw}),
+    ('HalvingGridSearchCV and Bootstrapping on training set only',
+     HalvingGridSearchCV(boot_pipeline, boot_param_grid, factor=3, resource='n_samples', min_resources='exhaust',
+                         cv=cv, scoring='accuracy', n_jobs=-1, random_state=42),
+     {}),
+]
+
+dt_searches = {}
+for name, search, fit_params in dt_candidates:
+    search.fit(X_train, y_train, **fit_params)
+    dt_searches[name] = search
+
+    print("Best Hyperparameters:", search.best_params_)
+
+    # Evaluate the best model
+    best_clf = search.best_estimator_
+    y_pred = best_clf.predict(X_test)
+    cm, accuracy, precision, recall, f1, support = eval_from_cm(y_test, y_pred, labels=best_clf.classes_)
+    print(f"Decision Tree Accuracy (with {name}): {accuracy}")
+
+    # Plot the decision tree (the last step of the bootstrapping pipeline)
+    if PLOT:
+        plt.figure(figsize=(20, 10))
+        plot_tree(best_clf[-1] if hasattr(best_clf, 'steps') else best_clf, feature_names=feature_names,
+                  class_names=class_names, filled=True, rounded=True, fontsize=8)
+        plt.show()
+
+    # Plot Confusion Matrix
+    plot_cm(cm, class_names, "Confusion Matrix")
+
+    print(pd.DataFrame({'precision': precision, 'recall': recall, 'f1-score': f1, 'support': support}, index=class_names).round(2))
 
 """#Random Forests
 
@@ -974,260 +1003,168 @@ For random forest, we cannot plot the tree since we would have several. We can p
 1. Feature importance.
 2. Confusion matrix.
 
-Simple random forest with cross-validation
-"""
+To contain the computational cost, the simple and the weighted models below are fitted with a Histogram Gradient Boosting classifier (HistGradientBoostingClassifier): the features are binned once into at most 255 buckets and the splits are searched on the histograms of the bins, which is much faster than the exact splits of the Random Forest. These models do not provide impurity-based feature importances, therefore we compute permutation importances on the test set. The bootstrapping and class-weighting blocks keep the Random Forest.
 
-X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)
+Simple histogram gradient boosting with cross-validation
+"""
 
-# Initialize the Random Forest Classifier with GridSearchCV
+# Initialize the Histogram Gradient Boosting Classifier with HalvingGridSearchCV. The halving resource is the number of
+# boosting iterations: the 12 candidates are evaluated with 44, 132 and then 396 iterations ('exhaust' sets the smallest
+# budget so that the last round uses nearly the maximum of 400), the weakest two thirds being discarded at each round
 param_grid = {
-    'n_estimators': [50, 100, 200],
-    'max_depth': [None, 10, 20],
-    'min_samples_split': [2, 5, 10],
-    'min_samples_leaf': [1, 2, 4]
+    'max_depth': [None, 8, 16],
+    'learning_rate': [0.05, 0.1],
+    'l2_regularization': [0.0, 1.0]
 }
 
-rf_clf = RandomForestClassifier(random_state=42)
-grid_search = GridSearchCV(rf_clf, param_grid, cv=5, scoring='accuracy')
+hgb_clf = HistGradientBoostingClassifier(random_state=42)
+grid_search = HalvingGridSearchCV(hgb_clf, param_grid, factor=3, resource='max_iter', min_resources='exhaust',
+                                  max_resources=400, cv=cv, scoring='accuracy', n_jobs=-1)
 grid_search.fit(X_train, y_train)
 
-best_rf_clf = grid_search.best_estimator_
-y_pred = best_rf_clf.predict(X_test)
+best_hgb_clf = grid_search.best_estimator_
+y_pred = best_hgb_clf.predict(X_test)
 
 # Evaluate the model
-accuracy = accuracy_score(y_test, y_pred)
-print(f"Random Forest Accuracy (with GridSearchCV): {accuracy}")
+cm, accuracy, precision, recall, f1, support = eval_from_cm(y_test, y_pred, labels=best_hgb_clf.classes_)
+print(f"Histogram Gradient Boosting Accuracy (with HalvingGridSearchCV): {accuracy}")
 
-# Feature Importance
-feature_importances = best_rf_clf.feature_importances_
-feature_importance_df = pd.DataFrame({'Feature': X.columns, 'Importance': feature_importances})
-feature_importance_df = feature_importance_df.sort_values(by='Importance', ascending=False)
-print("\nFeature Importance:")
-print(feature_importance_df)
-
-
-# Plot feature importance
-plt.figure(figsize=(12, 6))
-plt.bar(feature_importance_df['Feature'], feature_importance_df['Importance'])
-plt.xlabel('Features')
-plt.ylabel('Importance')
-plt.title('Feature Importance in Random Forest')
-plt.xticks(rotation=90)
-plt.tight_layout()
-plt.show()
+# Permutation importance: decrease in test accuracy when the values of each feature are shuffled
+perm = permutation_importance(best_hgb_clf, X_test, y_test, scoring='accuracy', n_repeats=10, random_state=42, n_jobs=-1)
+feature_importances = perm.importances_mean
+feature_importances = plot_importances(feature_importances, feature_names, 'Permutation Feature Importance in Histogram Gradient Boosting')
 
 
 #Plot Confusion Matrix
-cm = confusion_matrix(y_test, y_pred)
-class_names = [target_names[c] for c in best_rf_clf.classes_]
-plt.figure(figsize=(8, 6))
-sns.heatmap(cm, annot=True, fmt="d", cmap="Blues", cbar=False,
-            xticklabels=class_names,
-            yticklabels=class_names)
-plt.xlabel("Predicted Label")
-plt.ylabel("True Label")
-plt.title("Confusion Matrix")
-plt.show()
+class_names = label_lut[best_hgb_clf.classes_].tolist()
+plot_cm(cm, class_names, "Confusion Matrix")
 
-"""1) Random forest + SMOTE"""
+"""1) Histogram gradient boosting + balanced class weights (in place of SMOTE)"""
 
-X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)
-
-smote = SMOTE(random_state=42)
-X_train_resampled, y_train_resampled = smote.fit_resample(X_train, y_train)
+# Class-balanced weights instead of SMOTE (class_weight='balanced'), as in the Decision Tree models above
 
 param_grid = {
-    'n_estimators': [50, 100, 200],
-    'max_depth': [None, 10, 20],
-    'min_samples_split': [2, 5, 10],
-    'min_samples_leaf': [1, 2, 4]
+    'max_depth': [None, 8, 16],
+    'learning_rate': [0.05, 0.1],
+    'l2_regularization': [0.0, 1.0]
 }
 
-rf_clf = RandomForestClassifier(random_state=42)
-grid_search = GridSearchCV(rf_clf, param_grid, cv=5, scoring='accuracy')
-grid_search.fit(X_train_resampled, y_train_resampled)
+hgb_clf = HistGradientBoostingClassifier(class_weight='balanced', random_state=42)
+grid_search = HalvingGridSearchCV(hgb_clf, param_grid, factor=3, resource='max_iter', min_resources='exhaust',
+                                  max_resources=400, cv=cv, scoring='accuracy', n_jobs=-1)
+grid_search.fit(X_train, y_train)
 
-best_rf_clf = grid_search.best_estimator_
-y_pred = best_rf_clf.predict(X_test)
+best_hgb_clf = grid_search.best_estimator_
+y_pred = best_hgb_clf.predict(X_test)
 
 # Evaluate the model
-accuracy = accuracy_score(y_test, y_pred)
-print(f"Random Forest Accuracy (with GridSearchCV and SMOTE): {accuracy}")
+cm, accuracy, precision, recall, f1, support = eval_from_cm(y_test, y_pred, labels=best_hgb_clf.classes_)
+print(f"Histogram Gradient Boosting Accuracy (with HalvingGridSearchCV and balanced class weights): {accuracy}")
 
-# Feature Importance
-feature_importances = best_rf_clf.feature_importances_
-feature_importance_df = pd.DataFrame({'Feature': X.columns, 'Importance': feature_importances})
-feature_importance_df = feature_importance_df.sort_values(by='Importance', ascending=False)
-print("\nFeature Importance:")
-print(feature_importance_df)
-
-# Plot feature importance
-plt.figure(figsize=(12, 6))
-plt.bar(feature_importance_df['Feature'], feature_importance_df['Importance'])
-plt.xlabel('Features')
-plt.ylabel('Importance')
-plt.title('Feature Importance in Random Forest')
-plt.xticks(rotation=90)
-plt.tight_layout()
-plt.show()
+# Permutation importance, as above
+perm = permutation_importance(best_hgb_clf, X_test, y_test, scoring='accuracy', n_repeats=10, random_state=42, n_jobs=-1)
+feature_importances = perm.importances_mean
+feature_importances = plot_importances(feature_importances, feature_names, 'Permutation Feature Importance in Histogram Gradient Boosting')
 
 #Plot Confusion Matrix
-cm = confusion_matrix(y_test, y_pred)
-class_names = [target_names[c] for c in best_rf_clf.classes_]
-plt.figure(figsize=(8, 6))
-sns.heatmap(cm, annot=True, fmt="d", cmap="Blues", cbar=False,
-            xticklabels=class_names,
-            yticklabels=class_names)
-plt.xlabel("Predicted Label")
-plt.ylabel("True Label")
-plt.title("Confusion Matrix")
-plt.show()
+class_names = label_lut[best_hgb_clf.classes_].tolist()
+plot_cm(cm, class_names, "Confusion Matrix")
 
-print(classification_report(y_test, y_pred))
+print(pd.DataFrame({'precision': precision, 'recall': recall, 'f1-score': f1, 'support': support}, index=class_names).round(2))
 
 """Here we perform the same model but doing cross-validation through Random Search."""
 
-X_train, X_test, y_train, y_test = train_test_split(
-    X, y, test_size=0.2, random_state=42, stratify=y
-)
-
-smote = SMOTE(random_state=42)
-X_train_resampled, y_train_resampled = smote.fit_resample(X_train, y_train)
+# Class-balanced weights instead of SMOTE (class_weight='balanced'), as above
 
 # Randomized Search parameters
 param_dist = {
-    'n_estimators': [100, 200, 300, 400, 500],
-    'max_depth': [10, 20, 30, 40, None],
-    'min_samples_split': [2, 5, 10],
-    'min_samples_leaf': [1, 2, 4],
-    'max_features': ['auto', 'sqrt', 'log2']
+    'max_iter': [100, 200, 300, 400],
+    'max_depth': [None, 4, 8, 16],
+    'learning_rate': [0.03, 0.05, 0.1, 0.2],
+    'min_samples_leaf': [10, 20, 40],
+    'l2_regularization': [0.0, 0.5, 1.0]
 }
 
 
-rf_clf = RandomForestClassifier(random_state=42)
-
-# StratifiedKFold for balanced cross-validation + RandomisedSearch
-cv = StratifiedKFold(n_splits=5, shuffle=True, random_state=42)
+hgb_clf = HistGradientBoostingClassifier(class_weight='balanced', random_state=42)
 
 random_search = RandomizedSearchCV(
-    rf_clf, param_distributions=param_dist, n_iter=50, cv=cv,
+    hgb_clf, param_distributions=param_dist, n_iter=50, cv=cv,
     scoring='accuracy', random_state=60, n_jobs=-1, verbose=1
 )
 
-random_search.fit(X_train_resampled, y_train_resampled)
-best_rf_clf = random_search.best_estimator_
-y_pred = best_rf_clf.predict(X_test)
+random_search.fit(X_train, y_train)
+best_hgb_clf = random_search.best_estimator_
+y_pred = best_hgb_clf.predict(X_test)
 
 # Evaluate
-accuracy = accuracy_score(y_test, y_pred)
-print(f"Random Forest Accuracy (with RandomizedSearchCV and SMOTE): {accuracy:.4f}")
-
-# Feature importance
-feature_importances = best_rf_clf.feature_importances_
-feature_importance_df = pd.DataFrame({
-    'Feature': X.columns,
-    'Importance': feature_importances
-}).sort_values(by='Importance', ascending=False)
+cm, accuracy, precision, recall, f1, support = eval_from_cm(y_test, y_pred, labels=best_hgb_clf.classes_)
+print(f"Histogram Gradient Boosting Accuracy (with RandomizedSearchCV and balanced class weights): {accuracy:.4f}")
 
-# Plot feature importance
-plt.figure(figsize=(12, 6))
-sns.barplot(data=feature_importance_df, x='Feature', y='Importance')
-plt.title("Feature Importance in Random Forest")
-plt.xticks(rotation=90)
-plt.tight_layout()
-plt.show()
+# Permutation importance, as above
+perm = permutation_importance(best_hgb_clf, X_test, y_test, scoring='accuracy', n_repeats=10, random_state=42, n_jobs=-1)
+feature_importances = perm.importances_mean
+feature_importances = plot_importances(feature_importances, feature_names, 'Permutation Feature Importance in Histogram Gradient Boosting')
 
 # Plot confusion matrix
-cm = confusion_matrix(y_test, y_pred)
-plt.figure(figsize=(8, 6))
-sns.heatmap(cm, annot=True, fmt="d", cmap="Blues", cbar=False,
-            xticklabels=class_names, yticklabels=class_names)
-plt.xlabel("Predicted Label")
-plt.ylabel("True Label")
-plt.title("Confusion Matrix")
-plt.tight_layout()
-plt.show()
+plot_cm(cm, class_names, "Confusion Matrix")
 
 
 print("\nClassification Report:")
-print(classification_report(y_test, y_pred, target_names=class_names))
+print(pd.DataFrame({'precision': precision, 'recall': recall, 'f1-score': f1, 'support': support}, index=class_names).round(2))
 
-"""2) Random forest + Bootstrapping"""
+"""2) Random forest + Bootstrapping (balanced bootstrap samples for each tree)"""
 
-X_train, X_test, y_train, y_test = train_test_split(
-    X, y, test_size=0.2, random_state=42, stratify=y
-)
-
-# Bootstrapping for training set
-ros = RandomOverSampler(random_state=42)
-X_train_resampled, y_train_resampled = ros.fit_resample(X_train, y_train)
+# Bootstrapping inside the forest: each tree is grown on its own bootstrap sample, drawn with replacement and balanced
+# across all the classes, so the oversampled training set is never materialised
+# Alternative: a standard Random Forest on the oversampled training folds,
+# ImbPipeline([('ros', RandomOverSampler(random_state=42)), ('clf', RandomForestClassifier(...))], memory=mem)
 
 param_grid = {
-    'n_estimators': [50, 100, 200],
     'max_depth': [None, 10, 20],
     'min_samples_split': [2, 5, 10],
     'min_samples_leaf': [1, 2, 4]
 }
 
-rf_clf = RandomForestClassifier(random_state=42)
-grid_search = GridSearchCV(rf_clf, param_grid, cv=5, scoring='accuracy')
-grid_search.fit(X_train_resampled, y_train_resampled)
+# The cross-validation search runs the fits in parallel (n_jobs=-1), so each forest is trained on a single core (n_jobs=1)
+# to avoid nested parallelism oversubscribing the CPUs
+rf_clf = BalancedRandomForestClassifier(sampling_strategy='all', replacement=True, bootstrap=True, random_state=42, n_jobs=1)
+# The halving resource is the number of trees: with min_resources='exhaust' the rounds use 7, 21, 63 and then 189 trees,
+# so that the best candidates are evaluated with nearly the maximum of 200
+grid_search = HalvingGridSearchCV(rf_clf, param_grid, factor=3, resource='n_estimators', min_resources='exhaust',
+                                  max_resources=200, cv=cv, scoring='accuracy', n_jobs=-1)
+grid_search.fit(X_train, y_train)
 
 best_rf_clf = grid_search.best_estimator_
 y_pred = best_rf_clf.predict(X_test)
 
 # Evaluate the model
-accuracy = accuracy_score(y_test, y_pred)
-print(f"Random Forest Accuracy (with GridSearchCV and Bootstrapping on training set only): {accuracy}")
+cm, accuracy, precision, recall, f1, support = eval_from_cm(y_test, y_pred, labels=best_rf_clf.classes_)
+print(f"Random Forest Accuracy (with HalvingGridSearchCV and Bootstrapping on training set only): {accuracy}")
 
 # Feature Importance
 feature_importances = best_rf_clf.feature_importances_
-feature_importance_df = pd.DataFrame({'Feature': X.columns, 'Importance': feature_importances})
-feature_importance_df = feature_importance_df.sort_values(by='Importance', ascending=False)
-print("\nFeature Importance:")
-print(feature_importance_df)
-
-# Plot feature importance
-plt.figure(figsize=(12, 6))
-plt.bar(feature_importance_df['Feature'], feature_importance_df['Importance'])
-plt.xlabel('Features')
-plt.ylabel('Importance')
-plt.title('Feature Importance in Random Forest')
-plt.xticks(rotation=90)
-plt.tight_layout()
-plt.show()
+feature_importances = plot_importances(feature_importances, feature_names, 'Feature Importance in Random Forest')
 
 # Plot Confusion Matrix
-cm = confusion_matrix(y_test, y_pred)
-class_names = [target_names[c] for c in best_rf_clf.classes_]
-plt.figure(figsize=(8, 6))
-sns.heatmap(cm, annot=True, fmt="d", cmap="Blues", cbar=False,
-            xticklabels=class_names,
-            yticklabels=class_names)
-plt.xlabel("Predicted Label")
-plt.ylabel("True Label")
-plt.title("Confusion Matrix")
-plt.show()
+class_names = label_lut[best_rf_clf.classes_].tolist()
+plot_cm(cm, class_names, "Confusion Matrix")
 
-print(classification_report(y_test, y_pred))
+print(pd.DataFrame({'precision': precision, 'recall': recall, 'f1-score': f1, 'support': support}, index=class_names).round(2))
 
 """3) Random forest + Weighting"""
 
-X_train, X_test, y_train, y_test = train_test_split(
-    X, y, test_size=0.2, random_state=42, stratify=y
-)
-
-# GridSearchCV with weighted RandomForestClassifier
+# HalvingGridSearchCV with weighted RandomForestClassifier
 param_grid = {
-    'n_estimators': [50, 100, 200],
     'max_depth': [None, 10, 20],
     'min_samples_split': [2, 5, 10],
     'min_samples_leaf': [1, 2, 4],
     'class_weight': ['balanced', 'balanced_subsample']
 }
 
-rf_clf = RandomForestClassifier(random_state=42)
-grid_search = GridSearchCV(rf_clf, param_grid, cv=5, scoring='accuracy')
+rf_clf = RandomForestClassifier(random_state=42, n_jobs=1)
+grid_search = HalvingGridSearchCV(rf_clf, param_grid, factor=3, resource='n_estimators', min_resources='exhaust',
+                                  max_resources=200, cv=cv, scoring='accuracy', n_jobs=-1)
 grid_search.fit(X_train, y_train)
 
 best_rf_clf = grid_search.best_estimator_
@@ -1236,41 +1173,18 @@ print("Best Hyperparameters:", grid_search.best_params_)
 
 # Predictions and evaluation
 y_pred = best_rf_clf.predict(X_test)
-accuracy = accuracy_score(y_test, y_pred)
-print(f"Random Forest Accuracy (with GridSearchCV and class weights): {accuracy}")
+cm, accuracy, precision, recall, f1, support = eval_from_cm(y_test, y_pred, labels=best_rf_clf.classes_)
+print(f"Random Forest Accuracy (with HalvingGridSearchCV and class weights): {accuracy}")
 
 # Feature Importance
 feature_importances = best_rf_clf.feature_importances_
-feature_importance_df = pd.DataFrame({
-    'Feature': X.columns,
-    'Importance': feature_importances
-}).sort_values(by='Importance', ascending=False)
-
-print("\nFeature Importance:")
-print(feature_importance_df)
-
-# Plot feature importance
-plt.figure(figsize=(12, 6))
-plt.bar(feature_importance_df['Feature'], feature_importance_df['Importance'])
-plt.xlabel('Features')
-plt.ylabel('Importance')
-plt.title('Feature Importance in Random Forest')
-plt.xticks(rotation=90)
-plt.tight_layout()
-plt.show()
+feature_importances = plot_importances(feature_importances, feature_names, 'Feature Importance in Random Forest')
 
 # Confusion Matrix
-cm = confusion_matrix(y_test, y_pred)
-class_names = [target_names[c] for c in best_rf_clf.classes_]
-plt.figure(figsize=(8, 6))
-sns.heatmap(cm, annot=True, fmt="d", cmap="Blues", cbar=False,
-            xticklabels=class_names, yticklabels=class_names)
-plt.xlabel("Predicted Label")
-plt.ylabel("True Label")
-plt.title("Confusion Matrix")
-plt.show()
+class_names = label_lut[best_rf_clf.classes_].tolist()
+plot_cm(cm, class_names, "Confusion Matrix")
 
-print(classification_report(y_test, y_pred))
+print(pd.DataFrame({'precision': precision, 'recall': recall, 'f1-score': f1, 'support': support}, index=class_names).round(2))
 
 """#XG Boost
 
@@ -1279,79 +1193,80 @@ Boosting takes advantage of trees which are trained sequentially, with each one
 We initially perform a XG Boost without without SMOTE/bootstrapping
 """
 
-X_train, X_test, y_train, y_test = train_test_split(
-    X, y, test_size=0.2, stratify=y, random_state=42
-)
+import shutil
+
+# The boosters use the histogram algorithm, which runs on the GPU when XGBoost is built with CUDA and a device is present.
+# On the GPU the searches fit one candidate at a time (the device is the bottleneck), otherwise they use all the cores.
+# Nested parallelism is disabled on purpose: when the search runs the fits in parallel, each booster uses a single thread
+# (and vice versa), since both at once would oversubscribe the CPUs
+XGB_DEVICE = 'cuda' if xgb.build_info().get('USE_CUDA') and shutil.which('nvidia-smi') else 'cpu'
+XGB_SEARCH_JOBS = 1 if XGB_DEVICE == 'cuda' else -1
+XGB_N_JOBS = -1 if XGB_DEVICE == 'cuda' else 1
 
-# Adjust target variable for XGBoost (Shift labels to [0, 1, 2, 3])
+# Adjust target variable for XGBoost (Shift labels to [0, 1, 2, 3]), once for all the XGBoost models
 y_train_xgb = y_train - 1
 y_test_xgb = y_test - 1
 
-# Initialize XGBoost classifier with GridSearchCV
-param_grid = {
-    'max_depth': [3, 4, 5, 6],
-    'learning_rate': [0.1, 0.01, 0.001],
-    'n_estimators': [100, 200, 300],
+# Instead of searching the number of trees, the boosters grow up to 500 trees with early stopping: training stops once the
+# log-loss on a validation set (15% of the training set, held out from the searches) has not improved for 20 rounds
+X_fit, X_val, y_fit, y_val = train_test_split(X_train, y_train_xgb, test_size=0.15, random_state=42, stratify=y_train_xgb)
+XGB_EARLY_STOPPING = {'n_estimators': 500, 'early_stopping_rounds': 20, 'eval_metric': 'mlogloss'}
+
+# Initialize XGBoost classifier with RandomizedSearchCV: the full grid would have 108 combinations (324 with the number
+# of trees) with highly correlated scores, so we sample 30 candidates (learning rate on a log scale). The XGBoost searches
+# do not use successive halving: its small, non-stratified subsamples can leave a coalition out of a training fold, which
+# XGBoost rejects (error_score='raise' makes such a failure stop the search instead of scoring the candidate NaN)
+param_dist = {
+    'max_depth': randint(3, 7),
+    'learning_rate': loguniform(1e-3, 0.3),
     'subsample': [0.8, 0.9, 1.0],
     'colsample_bytree': [0.8, 0.9, 1.0]
 }
 
-xgb_clf = xgb.XGBClassifier(objective='multi:softmax', num_class=4, random_state=60)
-grid_search = GridSearchCV(xgb_clf, param_grid, cv=5, scoring='accuracy') # Use accuracy scoring
-grid_search.fit(X_train, y_train_xgb)
+xgb_clf = xgb.XGBClassifier(objective='multi:softmax', num_class=4, tree_method='hist', device=XGB_DEVICE, n_jobs=XGB_N_JOBS,
+                            random_state=60, **XGB_EARLY_STOPPING)
+grid_search = RandomizedSearchCV(xgb_clf, param_dist, n_iter=30, cv=cv, scoring='accuracy', error_score='raise',
+                                 n_jobs=XGB_SEARCH_JOBS, random_state=42) # Use accuracy scoring
+grid_search.fit(X_fit, y_fit, eval_set=[(X_val, y_val)], verbose=False)
 
 best_xgb_clf = grid_search.best_estimator_
 y_pred_xgb = best_xgb_clf.predict(X_test)
 
 # Evaluate accuracy
-accuracy = accuracy_score(y_test_xgb, y_pred_xgb)
-print(f"XGBoost Accuracy (with GridSearchCV): {accuracy}")
+cm, accuracy, precision, recall, f1, support = eval_from_cm(y_test_xgb, y_pred_xgb, labels=best_xgb_clf.classes_)
+print(f"XGBoost Accuracy (with RandomizedSearchCV): {accuracy}")
 
 # Plot feature importance
-xgb.plot_importance(best_xgb_clf) # Use best_xgb_clf
-plt.show()
+feature_importances = plot_importances(best_xgb_clf.feature_importances_, feature_names, 'Feature Importance - XGBoost')
 
 # Plot Confusion Matrix
-cm = confusion_matrix(y_test_xgb, y_pred_xgb)
-plt.figure(figsize=(8, 6))
-sns.heatmap(cm, annot=True, fmt="d", cmap="Blues", cbar=False,
-            xticklabels=class_names,
-            yticklabels=class_names)
-plt.xlabel("Predicted Label")
-plt.ylabel("True Label")
-plt.title("Confusion Matrix")
-plt.show()
-
-"""1) XG Boost + SMOTE"""
-
-X_train, X_test, y_train, y_test = train_test_split(
-    X, y, test_size=0.2, stratify=y, random_state=42
-)
+plot_cm(cm, class_names, "Confusion Matrix")
 
-y_train_xgb = y_train - 1
-y_test_xgb = y_test - 1
+"""1) XG Boost + balanced sample weights (in place of SMOTE)"""
 
-# Apply SMOTE
-smote = SMOTE(random_state=42)
-X_train_resampled, y_train_resampled = smote.fit_resample(X_train, y_train_xgb)
+# Class-balanced sample weights instead of SMOTE, as in the Decision Tree models above
+sw = compute_sample_weight('balanced', y_fit)
 
 xgb_clf = xgb.XGBClassifier(
     objective='multi:softmax',
     num_class=4,
-    use_label_encoder=False,
-    eval_metric='mlogloss',
-    random_state=60
+    tree_method='hist',
+    device=XGB_DEVICE,
+    n_jobs=XGB_N_JOBS,
+    random_state=60,
+    **XGB_EARLY_STOPPING
 )
 
 # Define parameter grid
 param_grid = {
     'max_depth': [3, 4, 5, 6],
-    'n_estimators': [50, 100, 150],
     'learning_rate': [0.01, 0.1, 0.2]
 }
 
-grid_search = GridSearchCV(xgb_clf, param_grid, cv=3, scoring='accuracy', verbose=1, n_jobs=-1)
-grid_search.fit(X_train_resampled, y_train_resampled)
+# Exhaustive grid on the whole fit set (no successive halving for XGBoost, see above)
+grid_search = GridSearchCV(xgb_clf, param_grid, cv=cv, scoring='accuracy', error_score='raise', verbose=1,
+                           n_jobs=XGB_SEARCH_JOBS)
+grid_search.fit(X_fit, y_fit, sample_weight=sw, eval_set=[(X_val, y_val)], verbose=False)
 
 best_xgb = grid_search.best_estimator_
 print("Best hyperparameters:", grid_search.best_params_)
@@ -1360,85 +1275,60 @@ y_pred_xgb = best_xgb.predict(X_test)
 
 
 # Evaluate
-accuracy = accuracy_score(y_test_xgb, y_pred_xgb)
-print(f"XGBoost Accuracy (with SMOTE + GridSearchCV): {accuracy}")
-print(classification_report(y_test_xgb, y_pred_xgb))
+cm, accuracy, precision, recall, f1, support = eval_from_cm(y_test_xgb, y_pred_xgb, labels=best_xgb.classes_)
+print(f"XGBoost Accuracy (with balanced sample weights + GridSearchCV): {accuracy}")
+print(pd.DataFrame({'precision': precision, 'recall': recall, 'f1-score': f1, 'support': support}, index=class_names).round(2))
 
 # Confusion Matrix
-cm = confusion_matrix(y_test_xgb, y_pred_xgb)
-plt.figure(figsize=(8, 6))
-sns.heatmap(cm, annot=True, fmt="d", cmap="Blues", cbar=False,
-            xticklabels=class_names,
-            yticklabels=class_names)
-plt.xlabel("Predicted")
-plt.ylabel("Actual")
-plt.title("XGBoost Confusion Matrix")
-plt.show()
+plot_cm(cm, class_names, "XGBoost Confusion Matrix")
 
 # Feature Importance
-xgb.plot_importance(best_xgb)
-plt.title("Feature Importance - XGBoost")
-plt.tight_layout()
-plt.show()
+feature_importances = plot_importances(best_xgb.feature_importances_, feature_names, 'Feature Importance - XGBoost')
 
 """2) XG Boost + Bootstrapping"""
 
-X_train, X_test, y_train, y_test = train_test_split(
-    X, y, test_size=0.2, random_state=42, stratify=y
-)
-
-y_train_xgb = y_train - 1
-y_test_xgb = y_test - 1
-
-# Apply Bootstrapping
-ros = RandomOverSampler(random_state=42)
-X_train_resampled, y_train_resampled = ros.fit_resample(X_train, y_train_xgb)
-
 xgb_base = xgb.XGBClassifier(
     objective='multi:softmax',
     num_class=4,
-    use_label_encoder=False,
-    eval_metric='mlogloss',
-    random_state=60
+    tree_method='hist',
+    device=XGB_DEVICE,
+    n_jobs=XGB_N_JOBS,
+    random_state=60,
+    **XGB_EARLY_STOPPING
 )
 
+# Apply Bootstrapping as the first step of a pipeline, to the training folds only (cached across the candidates)
+xgb_pipeline = ImbPipeline([
+    ('ros', RandomOverSampler(random_state=42)),
+    ('clf', xgb_base)
+], memory=mem)
+
 param_grid = {
-    'max_depth': [3, 4, 5, 6],
-    'n_estimators': [100, 200],
-    'learning_rate': [0.05, 0.1],
-    'subsample': [0.8, 1.0],
-    'colsample_bytree': [0.8, 1.0]
+    'clf__max_depth': [3, 4, 5, 6],
+    'clf__learning_rate': [0.05, 0.1],
+    'clf__subsample': [0.8, 1.0],
+    'clf__colsample_bytree': [0.8, 1.0]
 }
 
-grid_search = GridSearchCV(xgb_base, param_grid, cv=5, scoring='accuracy', verbose=1, n_jobs=-1)
-grid_search.fit(X_train_resampled, y_train_resampled)
+grid_search = GridSearchCV(xgb_pipeline, param_grid, cv=cv, scoring='accuracy', error_score='raise', verbose=1,
+                           n_jobs=XGB_SEARCH_JOBS)
+grid_search.fit(X_fit, y_fit, clf__eval_set=[(X_val, y_val)], clf__verbose=False)
 
-best_xgb = grid_search.best_estimator_
+best_xgb = grid_search.best_estimator_[-1]
 y_pred_xgb = best_xgb.predict(X_test)
 
 # Print accuracy and best params
-accuracy = accuracy_score(y_test_xgb, y_pred_xgb)
+cm, accuracy, precision, recall, f1, support = eval_from_cm(y_test_xgb, y_pred_xgb, labels=best_xgb.classes_)
 print(f"XGBoost Accuracy (with bootstrapping + GridSearchCV): {accuracy:.4f}")
 print("Best hyperparameters:", grid_search.best_params_)
 
 # Feature importance
-xgb.plot_importance(best_xgb, max_num_features=15)
-plt.title("Top Feature Importances (XGBoost)")
-plt.tight_layout()
-plt.show()
+feature_importances = plot_importances(best_xgb.feature_importances_, feature_names, 'Top Feature Importances (XGBoost)')
 
 # Confusion matrix
-cm = confusion_matrix(y_test_xgb, y_pred_xgb)
-plt.figure(figsize=(8, 6))
-sns.heatmap(cm, annot=True, fmt="d", cmap="Blues", cbar=False,
-            xticklabels=class_names,
-            yticklabels=class_names)
-plt.xlabel("Predicted")
-plt.ylabel("True")
-plt.title("Confusion Matrix - XGBoost")
-plt.show()
+plot_cm(cm, class_names, "Confusion Matrix - XGBoost")
 
-print(classification_report(y_test_xgb, y_pred_xgb))
+print(pd.DataFrame({'precision': precision, 'recall': recall, 'f1-score': f1, 'support': support}, index=class_names).round(2))
 
 """#MLR
 
@@ -1447,51 +1337,131 @@ We finally move to Multinomial Logistic Regression, which is an extension of bin
 Firstly, we use MLR model for prediction (Classification in voted coalition).
 """
 
-from imblearn.pipeline import Pipeline as ImbPipeline
-
-X_train, X_test, y_train, y_test = train_test_split(
-    X, y, test_size=0.2, random_state=42, stratify=y
-)
-
-# Define pipeline with SMOTE, scaling, and logistic regression
+from imblearn import FunctionSampler
+from imblearn.under_sampling import RandomUnderSampler
+from joblib import parallel_config
+from numba import njit, prange
+from sklearn import config_context
+
+# SMOTE compiled with Numba on float32 arrays: for our sample size a brute-force search of the nearest neighbours is
+# faster than the tree-based search of imblearn, and the resampling runs once for each training fold of the searches.
+# The fast-math flags exclude 'ninf' and 'nnan' (the neighbour buffer starts at np.inf), and the compiled kernel is cached
+# on disk, so that the worker processes of the searches do not compile it again
+@njit(parallel=True, cache=True, fastmath={'nsz', 'arcp', 'contract', 'afn', 'reassoc'})
+def smote_class(X_min, n_synth, k, seed):
+    n, d = X_min.shape
+    # k nearest neighbours of each minority sample (squared euclidean distances, the sample itself excluded)
+    # kept sorted by insertion, so that each row costs O(n*k) instead of a full sort of the n distances
+    nn = np.empty((n, k), dtype=np.int64)
+    for i in prange(n):
+        best = np.full(k, np.inf, dtype=np.float32)
+        idx = np.zeros(k, dtype=np.int64)
+        for j in range(n):
+            if j == i:
+                continue
+            acc = np.float32(0.0)
+            for f in range(d):
+                diff = X_min[i, f] - X_min[j, f]
+                acc += diff * diff
+            if acc < best[k - 1]:
+                m = k - 1
+                while m > 0 and best[m - 1] > acc:
+                    best[m] = best[m - 1]
+                    idx[m] = idx[m - 1]
+                    m -= 1
+                best[m] = acc
+                idx[m] = j
+        nn[i] = idx
+    # Each synthetic sample lies on the segment between a random minority sample and one of its neighbours
+    np.random.seed(seed)
+    base = np.random.randint(0, n, n_synth)
+    neighbour = np.random.randint(0, k, n_synth)
+    gap = np.random.random(n_synth).astype(np.float32)
+    X_new = np.empty((n_synth, d), dtype=np.float32)
+    for s in prange(n_synth):
+        i = base[s]
+        j = nn[i, neighbour[s]]
+        for f in range(d):
+            X_new[s, f] = X_min[i, f] + gap[s] * (X_min[j, f] - X_min[i, f])
+    return X_new
+
+def smote_resample(X, y, k_neighbors=5, seed=42):
+    # Oversample every class up to the size of the majority class (as SMOTE(sampling_strategy='auto') does)
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    classes, counts = np.unique(y, return_counts=True)
+    X_parts, y_parts = [X], [y]
+    for c, n_c in zip(classes, counts):
+        n_synth = counts.max() - n_c
+        if n_synth == 0:
+            continue
+        if n_c < 2:
+            # A class with a single sample in the fold has no neighbour to interpolate with: its sample is duplicated
+            X_parts.append(np.repeat(X[y == c], n_synth, axis=0))
+        else:
+            X_parts.append(smote_class(np.ascontiguousarray(X[y == c]), n_synth, min(k_neighbors, n_c - 1), seed + int(c)))
+        y_parts.append(np.full(n_synth, c, dtype=y.dtype))
+    return np.concatenate(X_parts), np.concatenate(y_parts)
+
+def undersample_strategy(y, k_neighbors=5):
+    # Undersample the classes larger than twice the smallest one down to that size (the multiclass counterpart of
+    # RandomUnderSampler(sampling_strategy=0.5)), so that SMOTE only has to fill the remaining gap. When the smallest class
+    # has no more samples than SMOTE's neighbours (small subsamples of the halving searches), all the samples are kept
+    classes, counts = np.unique(y, return_counts=True)
+    if counts.min() <= k_neighbors:
+        return dict(zip(classes, counts))
+    return {c: min(n_c, 2 * counts.min()) for c, n_c in zip(classes, counts)}
+
+# The features are standardized before the resampling, so that the nearest neighbours of SMOTE are not dominated by the
+# features with the largest scales; the majority classes are then undersampled, and SMOTE generates the minority samples.
+# These steps do not depend on the hyperparameters of the regression: their fitted outputs are cached on disk (for each
+# training fold) with the joblib Memory defined above, so that across the candidates of the grid only the logistic
+# regression is refitted
+
+# Each penalty is fitted with the most suited solver: the stochastic 'saga' solver is needed only for the l1 penalty,
+# while the l2 penalty is fitted with 'lbfgs', which on a dataset of this size converges in far fewer iterations (both
+# solvers fit the multinomial model by default)
+lbfgs_clf = LogisticRegression(solver='lbfgs', penalty='l2', max_iter=1000, random_state=42)
+saga_clf = LogisticRegression(solver='saga', penalty='l1', max_iter=10000, random_state=42)
+
+# Names of the coalitions, in the sorted order of the labels, for the plots and reports of both searches
+class_names = label_lut[np.sort(pd.unique(y))].tolist()
+
+# Define pipeline with scaling, undersampling, SMOTE, and logistic regression
 pipeline = ImbPipeline([
-    ('smote', SMOTE(random_state=42)),
     ('scaler', StandardScaler()),
-    ('clf', LogisticRegression(multi_class='multinomial', solver='saga', max_iter=10000, random_state=42))
-])
-
-param_grid = {
-    'clf__C': [0.01, 0.1, 1, 10],  # Regularization strength
-    'clf__penalty': ['l2', 'l1'],  # Only works with 'saga' solver
-}
-
-# GridSearch with StratifiedKFold
-cv = StratifiedKFold(n_splits=5, shuffle=True, random_state=42)
-grid_search = GridSearchCV(pipeline, param_grid, cv=cv, scoring='accuracy', n_jobs=-1, verbose=1)
-grid_search.fit(X_train, y_train)
+    ('under', RandomUnderSampler(sampling_strategy=undersample_strategy, random_state=42)),
+    ('smote', FunctionSampler(func=smote_resample)), # Alternative: ('smote', SMOTE(random_state=42))
+    ('clf', lbfgs_clf)
+], memory=mem)
+
+C_values = [0.01, 0.1, 1, 10]  # Regularization strength
+param_grid = [
+    {'clf': [lbfgs_clf], 'clf__C': C_values},
+    {'clf': [saga_clf], 'clf__C': C_values}
+]
+
+# Both searches reuse the shared float32 split and only rank the candidates, so a stratified 3-fold CV is enough
+cv_mlr = StratifiedKFold(n_splits=3, shuffle=True, random_state=42)
+grid_search = HalvingGridSearchCV(pipeline, param_grid, factor=3, resource='n_samples', min_resources='exhaust',
+                                  cv=cv_mlr, scoring='accuracy', n_jobs=-1, verbose=1, random_state=42)
+# Within the search: one thread for each parallel fit (Numba SMOTE and BLAS), and no finiteness checks (no missing values)
+with config_context(assume_finite=True), parallel_config(backend='loky', inner_max_num_threads=1):
+    grid_search.fit(X_train, y_train)
 
 # Predictions
 best_model = grid_search.best_estimator_
 y_pred = best_model.predict(X_test)
 
-# Evaluation
-accuracy = accuracy_score(y_test, y_pred)
+# Evaluation (accuracy and per-class scores from a single confusion matrix, as for the tree models)
+cm, accuracy, precision, recall, f1, support = eval_from_cm(y_test, y_pred, labels=best_model.classes_)
 print(f"Multinomial Logistic Regression Accuracy: {accuracy:.4f}")
 
 # Confusion matrix
-cm = confusion_matrix(y_test, y_pred)
-plt.figure(figsize=(8, 6))
-sns.heatmap(cm, annot=True, fmt="d", cmap="Blues", cbar=False,
-            xticklabels=class_names, yticklabels=class_names)
-plt.xlabel("Predicted Label")
-plt.ylabel("True Label")
-plt.title("Confusion Matrix - Logistic Regression")
-plt.tight_layout()
-plt.show()
+plot_cm(cm, class_names, "Confusion Matrix - Logistic Regression")
 
-# Classification report
+# Per-class scores
 print("\nClassification Report:")
-print(classification_report(y_test, y_pred, target_names=class_names))
+print(pd.DataFrame({'precision': precision, 'recall': recall, 'f1-score': f1, 'support': support}, index=class_names).round(2))
 
 print("Best Hyperparameters:", grid_search.best_params_)
 
@@ -1501,121 +1471,126 @@ print("Best Hyperparameters:", grid_search.best_params_)
 
 # from sklearn.pipeline import Pipeline
 
-X_train, X_test, y_train, y_test = train_test_split(
-    X, y, test_size=0.2, stratify=y, random_state=42
-)
+# The subsamples of this search differ from those of the grid search above, so its cached steps cannot be reused: the
+# cache is cleared to bound its size on disk
+mem.clear(warn=False)
 
-# Define pipeline with SMOTE, scaling, and logistic regression
+# Define pipeline with scaling, undersampling, SMOTE, and logistic regression (cached as above)
 pipeline = ImbPipeline([
-    ('smote', SMOTE(random_state=42)),
     ('scaler', StandardScaler()),
-    ('clf', LogisticRegression(multi_class='multinomial', solver='saga', max_iter=10000, random_state=42))
-])
-
-# Hyperparameter space for random search
-param_dist = {
-    'clf__C': [0.01, 0.1, 0.5, 1, 5, 10],
-    'clf__penalty': ['l1', 'l2']
-}
-
-# Cross-validation and Randomized Search
-cv = StratifiedKFold(n_splits=5, shuffle=True, random_state=42)
-random_search = RandomizedSearchCV(
+    ('under', RandomUnderSampler(sampling_strategy=undersample_strategy, random_state=42)),
+    ('smote', FunctionSampler(func=smote_resample)), # Alternative: ('smote', SMOTE(random_state=42))
+    ('clf', LogisticRegression(max_iter=2000, random_state=42))
+], memory=mem)
+
+# Hyperparameter space for random search, with the solver paired to the penalty as in the grid search above (the l1
+# branch keeps a higher number of iterations, since saga converges more slowly). The regularization strength is drawn
+# on a log scale, so that the candidates explore the values between the points of the grid instead of repeating them
+C_dist = loguniform(1e-3, 1e2)
+param_dist = [
+    {'clf__C': C_dist, 'clf__penalty': ['l2'], 'clf__solver': ['lbfgs']},
+    {'clf__C': C_dist, 'clf__penalty': ['l1'], 'clf__solver': ['saga'], 'clf__max_iter': [10000]}
+]
+
+# Cross-validation and Randomized Search (with successive halving)
+random_search = HalvingRandomSearchCV(
     pipeline,
     param_distributions=param_dist,
-    n_iter=10,
-    cv=cv,
+    n_candidates=10,
+    factor=3,
+    resource='n_samples',
+    min_resources='exhaust',
+    cv=cv_mlr,
     scoring='accuracy',
     n_jobs=-1,
     verbose=1,
     random_state=42
 )
 
-random_search.fit(X_train, y_train)
+# One thread for each of the parallel fits, and no finiteness checks, as above
+with config_context(assume_finite=True), parallel_config(backend='loky', inner_max_num_threads=1):
+    random_search.fit(X_train, y_train)
 
 best_model = random_search.best_estimator_
 y_pred = best_model.predict(X_test)
 
 # Evaluation
-accuracy = accuracy_score(y_test, y_pred)
-print(f"Multinomial Logistic Regression Accuracy (RandomOverSampler): {accuracy:.4f}")
+cm, accuracy, precision, recall, f1, support = eval_from_cm(y_test, y_pred, labels=best_model.classes_)
+print(f"Multinomial Logistic Regression Accuracy (HalvingRandomSearchCV, undersampling + SMOTE): {accuracy:.4f}")
 
 # Confusion matrix
-cm = confusion_matrix(y_test, y_pred)
-class_names = sorted(y.unique())
-plt.figure(figsize=(8, 6))
-sns.heatmap(cm, annot=True, fmt="d", cmap="Blues", cbar=False,
-            xticklabels=class_names, yticklabels=class_names)
-plt.xlabel("Predicted Label")
-plt.ylabel("True Label")
-plt.title("Confusion Matrix - Logistic Regression (ROS)")
-plt.tight_layout()
-plt.show()
+plot_cm(cm, class_names, "Confusion Matrix - Logistic Regression (random search)")
 
-# Classification report
+# Per-class scores
 print("\nClassification Report:")
-#print(classification_report(y_test, y_pred, target_names=class_names))
+print(pd.DataFrame({'precision': precision, 'recall': recall, 'f1-score': f1, 'support': support}, index=class_names).round(2))
 
 print("Best Hyperparameters:", random_search.best_params_)
 
 """We move to a simple MLR on the overall dataset for statistical inference, retrieving interpretation on the coefficients."""
 
-# Standardize features (SCALE: 1SD increase)
-scaler = StandardScaler()
-X_scaled_array = scaler.fit_transform(X)
-X_scaled = pd.DataFrame(X_scaled_array, columns=X.columns)
+# Design matrix of both the inference models below, allocated once with the intercept column (instead of the copy made
+# by sm.add_constant). Unlike the prediction models, which train on float32, the inference models are fitted in float64,
+# for the precision of the gradients and of the standard errors
+n_obs, n_features = X.shape
+X_design = np.empty((n_obs, n_features + 1), dtype=np.float64)
+X_design[:, 0] = 1.0
+X_design[:, 1:] = X
 
-# Manually add intercept
-X_scaled = sm.add_constant(X_scaled)
+# Standardize features (SCALE: 1SD increase) in place
+scaler = StandardScaler().fit(X_design[:, 1:])
+X_design[:, 1:] -= scaler.mean_
+X_design[:, 1:] /= scaler.scale_
 
-# Fit multinomial logistic regression
-y = y.reset_index(drop=True)
+# The models are fitted on the numpy design matrix (without the pandas wrapping of statsmodels), and the names of the
+# regressors are attached to the summaries and odds ratios
+exog_names = ['const', *feature_names]
 
-model = sm.MNLogit(y, X_scaled)
-result = model.fit(method='newton', maxiter=100, full_output=True, disp=True)
+# Fit multinomial logistic regression with L-BFGS (gradient only, instead of forming and inverting the Hessian at each
+# Newton step): the Hessian is computed once at the optimum for the standard errors of the summary
+model = sm.MNLogit(y, X_design)
+result = model.fit(method='lbfgs', maxiter=200, full_output=True, disp=True)
 
-print(result.summary())
+print(result.summary(xname=exog_names))
 
-odds_ratios = np.exp(result.params)
+odds_ratios = pd.DataFrame(np.exp(result.params), index=exog_names)
 print("\nOdds Ratios:\n", odds_ratios)
 
 """Here try to change baseline category to M5S"""
 
-X = df_final2.drop('VotedCoalition', axis=1)
-y = df_final2['VotedCoalition'].reset_index(drop=True)
-
-# Standardize features
-scaler = StandardScaler()
-X_scaled_array = scaler.fit_transform(X)
-X_scaled = pd.DataFrame(X_scaled_array, columns=X.columns)
-
-X_scaled = sm.add_constant(X_scaled)
+# Same standardized features (and intercept) and target labels as the model above
 
 # We set y=2 as baseline by reordering categories - You may want to change it
-# Convert to categorical and reorder levels
-y_cat = pd.Categorical(y, categories=[2, 1, 3, 4], ordered=False)
-y_reordered = y_cat.codes
+# Reorder the levels with a lookup table indexed by the original labels (order 2, 1, 3, 4, index 0 unused)
+remap = np.array([-1, 1, 0, 2, 3], dtype=np.int8)
+y_reordered = remap[y]
 
 # Fit the model
-model = sm.MNLogit(y_reordered, X_scaled)
-result = model.fit(method='newton', maxiter=100, full_output=True, disp=True)
+model = sm.MNLogit(y_reordered, X_design)
+result = model.fit(method='lbfgs', maxiter=200, full_output=True, disp=True)
 
-print(result.summary())
+print(result.summary(xname=exog_names))
 
-odds_ratios = np.exp(result.params)
+odds_ratios = pd.DataFrame(np.exp(result.params), index=exog_names)
 print("\nOdds Ratios:\n", odds_ratios)
 
 """For a more direct interpretation of the coefficients:"""
 
 # Taking the 'result' as our fitted statsmodels MNLogit model from before, where 'odds_ratios' were calculated as np.exp(result.params)
+# (result.params is a numpy array, with one row per regressor of exog_names and one column per outcome category)
+
+# Percentage effects of a 1SD increase of every regressor on the odds of every outcome category vs the baseline, computed
+# in a single step over the whole coefficient matrix (np.expm1 computes exp(x) - 1 without the loss of precision of the
+# subtraction for coefficients close to 0)
+percentage_effects = pd.DataFrame(np.expm1(result.params) * 100, index=exog_names)
 
 # Example: Get the percentage effect of 'Age' on the odds of voting for M5S (column [0]) vs CSX (baseline)
-age_coefficient_m5s = result.params[0]['Age'] # Access the coefficient for Age for M5S (Index 0 is the first column in the results, M5S)
-percentage_effect_age_m5s = (np.exp(age_coefficient_m5s) - 1) * 100
+percentage_effect_age_m5s = percentage_effects.at['Age', 0] # Index 0 is the first column in the results, M5S
 
 print(f"Percentage effect of a 1SD increase in Age on the odds of voting for M5S vs CSX: {percentage_effect_age_m5s:.2f}%")
 
-# You can similarly extract percentage effects for other variables and other outcome categories using the correct coefficients from 'result.params'.
+# The percentage effects of the other variables and outcome categories are read from the same table
+print("\nPercentage effects (%):\n", percentage_effects.round(2))
 
 # Recall assigned names for interpretation
 coalition_mapping = label_names['VotedCoalition']